@@ -1,6 +1,10 @@
 import json
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import uuid
+import sqlite3
 import os
 from typing import Optional, Dict, List
 from datetime import datetime
@@ -31,6 +35,17 @@ class Cohere_LLM:
         if not self.api_key:
             raise ValueError("COHERE_API_KEY not found in environment variables")
 
+        # Reuse pooled keep-alive connections and retry rate limits / server errors
+        self._session = requests.Session()
+        retries = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            raise_on_status=False
+        )
+        self._session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retries))
+
     def _make_request(self, messages: List[Dict]) -> requests.Response:
         """Make request to Cohere API"""
         url = "https://api.cohere.com/v2/chat"
@@ -50,7 +65,7 @@ class Cohere_LLM:
             "presence_penalty": self.presence_penalty
         }
 
-        return requests.post(url, headers=headers, json=payload, stream=self.stream)
+        return self._session.post(url, headers=headers, json=payload, stream=self.stream)
 
 class Cohere_Chatbot:
     _chatbot_counter = 0
@@ -69,6 +84,7 @@ class Cohere_Chatbot:
         self.chatbot_id = Cohere_Chatbot._chatbot_counter
         self.name = name or f"cohere_chatbot_{self.chatbot_id}"
         self.conversation_folder = self._create_conversation_folder()
+        self._db = self._open_database()
         self.history: List[Dict] = []
         self._initialize_conversation()
 
@@ -96,27 +112,59 @@ class Cohere_Chatbot:
     def _initialize_conversation(self):
         """Initialize conversation with system prompt"""
         self.conversation_id = str(uuid.uuid4())
+        self._stream_buf: List[str] = []
+        self._stream_count = 0
         self.history = [{
             "role": "system",
             "content": self.system_prompt
         }]
-        self._save_conversation()
+        self._append_message(self.history[0])
 
-    def _save_conversation(self):
-        """Save conversation history to JSON file"""
-        filename = f"{self.conversation_folder}/conversation_{self.conversation_id}.json"
+    def _open_database(self) -> sqlite3.Connection:
+        """Open (and create if needed) the SQLite store holding all of this chatbot's conversations"""
+        # Autocommit with one statement per call, so sharing the connection across threads is safe
+        db = sqlite3.connect(f"{self.conversation_folder}/chats.db", isolation_level=None, check_same_thread=False)
         
-        conversation_data = {
-            "conversation_id": self.conversation_id,
-            "chatbot_name": self.name,
-            "chatbot_id": self.chatbot_id,
-            "timestamp": datetime.now().isoformat(),
-            "system_prompt": self.system_prompt,
-            "history": self.history
-        }
+        # WAL lets reads run alongside writes; NORMAL skips an fsync on every turn
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
         
-        with open(filename, 'w') as f:
-            json.dump(conversation_data, f, indent=2)
+        # Clustered on (conversation_id, turn_idx) so per-conversation reads are a single range scan
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                turn_idx INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                PRIMARY KEY (conversation_id, turn_idx)
+            ) WITHOUT ROWID
+        """)
+        return db
+
+    def _append_message(self, message: Dict):
+        """Store the latest history message as the next turn of the current conversation"""
+        self._db.execute(
+            "INSERT INTO messages (conversation_id, turn_idx, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+            (
+                self.conversation_id,
+                len(self.history) - 1,
+                message["role"],
+                orjson.dumps(message["content"]).decode('utf-8'),
+                datetime.now().isoformat()
+            )
+        )
+
+    def _import_history(self):
+        """Store the whole current history in the database"""
+        ts = datetime.now().isoformat()
+        self._db.executemany(
+            "INSERT OR IGNORE INTO messages (conversation_id, turn_idx, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+            [
+                (self.conversation_id, turn_idx, message["role"], orjson.dumps(message["content"]).decode('utf-8'), ts)
+                for turn_idx, message in enumerate(self.history)
+            ]
+        )
 
     def start_new_conversation(self):
         """Start a new conversation while maintaining chatbot identity"""
@@ -126,22 +174,41 @@ class Cohere_Chatbot:
 
     def list_conversations(self) -> List[str]:
         """List all conversations for this chatbot"""
-        conversations = [f for f in os.listdir(self.conversation_folder) 
-                        if f.startswith('conversation_') and f.endswith('.json')]
+        conversations = [row[0] for row in self._db.execute("SELECT DISTINCT conversation_id FROM messages")]
+        
+        # Conversations saved as files before the switch to SQLite
+        for f in os.listdir(self.conversation_folder):
+            if f.startswith('conversation_') and f.endswith('.json'):
+                conversation_id = f[len('conversation_'):-len('.json')]
+                if conversation_id not in conversations:
+                    conversations.append(conversation_id)
         return conversations
 
     def load_conversation(self, conversation_id: str):
         """Load a specific conversation"""
-        filename = f"{self.conversation_folder}/conversation_{conversation_id}.json"
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
+        rows = self._db.execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY turn_idx",
+            (conversation_id,)
+        ).fetchall()
+        legacy_filename = f"{self.conversation_folder}/conversation_{conversation_id}.json"
+        if rows:
+            self.history = [{"role": role, "content": orjson.loads(content)} for role, content in rows]
+            self.conversation_id = conversation_id
+        elif os.path.exists(legacy_filename):
+            # Conversations saved before the switch to SQLite hold the full history in one file
+            with open(legacy_filename, 'r') as f:
                 data = json.load(f)
                 self.conversation_id = data["conversation_id"]
                 self.history = data["history"]
-                if self.verbose:
-                    print(f"\nLoaded conversation: {conversation_id}")
         else:
             raise FileNotFoundError(f"Conversation {conversation_id} not found")
+        
+        # Move file-based conversations into the database so new turns extend them
+        if not rows:
+            self._import_history()
+        
+        if self.verbose:
+            print(f"\nLoaded conversation: {conversation_id}")
 
     def _prepare_messages(self, message: str) -> List[Dict]:
         """Prepare messages for API request"""
@@ -155,13 +222,24 @@ class Cohere_Chatbot:
         return self.history
 
     def _print_streaming_response(self, content: str):
-        """Print streaming response in a chat-like format"""
-        sys.stdout.write(content)
-        sys.stdout.flush()
+        """Print streaming response in a chat-like format, flushing on newlines or every 16 tokens"""
+        self._stream_buf.append(content)
+        self._stream_count += 1
+        if '\n' in content or self._stream_count >= 16:
+            self._flush_streaming_response()
+
+    def _flush_streaming_response(self):
+        """Write out any buffered streaming tokens"""
+        if self._stream_buf:
+            sys.stdout.write(''.join(self._stream_buf))
+            sys.stdout.flush()
+            self._stream_buf.clear()
+        self._stream_count = 0
 
     def __call__(self, message: str) -> str:
         """Process user message and return response"""
         messages = self._prepare_messages(message)
+        self._append_message(messages[-1])
         response = self.llm._make_request(messages)
 
         if self.verbose:
@@ -171,20 +249,26 @@ class Cohere_Chatbot:
         if self.llm.stream:
             collected_messages = []
             for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    try:
-                        data = json.loads(line)
-                        if data["type"] == "content-delta":
-                            content = data["delta"]["message"]["content"]["text"]
-                            collected_messages.append(content)
-                            if self.verbose:
-                                self._print_streaming_response(content)
-                    except json.JSONDecodeError:
-                        continue
+                # Skip blank keepalive, comment and SSE event-name lines before parsing
+                if not line or line.startswith((b':', b'event:')):
+                    continue
+                if line.startswith(b'data:'):
+                    line = line[5:].lstrip()
+                try:
+                    data = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                if not isinstance(data, dict):
+                    continue
+                if data.get("type") == "content-delta":
+                    content = data["delta"]["message"]["content"]["text"]
+                    collected_messages.append(content)
+                    if self.verbose:
+                        self._print_streaming_response(content)
 
             full_response = "".join(collected_messages)
             if self.verbose:
+                self._flush_streaming_response()
                 print("\n")
         else:
             response_data = response.json()
@@ -199,6 +283,6 @@ class Cohere_Chatbot:
                 "text": full_response
             }
         })
-        self._save_conversation()
+        self._append_message(self.history[-1])
 
         return full_response
@@ -1,31 +1,101 @@
 import json
+import math
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import mmap
+import platform
+import warnings
 import faiss
 import numpy as np
 from typing import Optional, List, Union, Dict, Tuple
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 
 # Load environment variables
 load_dotenv()
 
+# faiss-cpu>=1.8 wheels dispatch to AVX2/AVX512 distance kernels at runtime;
+# a generic build is several times slower on x86 machines that support them.
+# Older FAISS releases lack these introspection helpers, so skip the check there
+_supported_instruction_sets = getattr(faiss, "supported_instruction_sets", None)
+_get_compile_options = getattr(faiss, "get_compile_options", None)
+if (
+    _supported_instruction_sets is not None
+    and _get_compile_options is not None
+    and platform.machine().lower() in ("x86_64", "amd64")
+    and "AVX2" in _supported_instruction_sets()
+    and "AVX2" not in _get_compile_options()
+):
+    warnings.warn("FAISS is running without AVX2 kernels; install faiss-cpu>=1.8 for SIMD-accelerated search")
+
 class OpenAI_Embedding:
+    # Below this many vectors a brute-force flat index is fast enough
+    FLAT_INDEX_THRESHOLD = 10000
+    
+    # Query-time parameters used when neither the constructor nor the saved index sets them
+    DEFAULT_NPROBE = 16
+    DEFAULT_EF_SEARCH = 64
+
     def __init__(
         self,
         model: str = "text-embedding-ada-002",
         encoding_format: str = "float",
         api_key: Optional[str] = None,
-        index_directory: str = "faiss_indexes"
+        index_directory: str = "faiss_indexes",
+        index_type: str = "auto",
+        nprobe: Optional[int] = None,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: Optional[int] = None,
+        store_embeddings: str = "none",
+        num_threads: Optional[int] = None,
+        use_gpu: bool = False,
+        batch_size: int = 2048,
+        max_parallel: int = 8,
+        index_cache_size: int = 8
     ):
         self.model = model
         self.encoding_format = encoding_format
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         self.index_directory = index_directory
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.store_embeddings = store_embeddings
+        self.num_threads = num_threads
+        self.use_gpu = use_gpu
+        self._gpu_resources = None
+        self.batch_size = batch_size
+        self.max_parallel = max_parallel
+        self.index_cache_size = index_cache_size
+        self._index_cache: Dict[str, Tuple[faiss.Index, Dict, np.ndarray, Union[mmap.mmap, bytes]]] = OrderedDict()
         
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
         
+        if self.index_type not in ("auto", "hnsw"):
+            raise ValueError(f"Unsupported index_type: {self.index_type}. Use 'auto' or 'hnsw'")
+        
+        if self.store_embeddings not in ("none", "fp32", "fp16", "int8"):
+            raise ValueError(f"Unsupported store_embeddings: {self.store_embeddings}. Use 'none', 'fp32', 'fp16' or 'int8'")
+        
+        # Reuse pooled keep-alive connections and retry rate limits / server errors
+        self._session = requests.Session()
+        retries = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            raise_on_status=False
+        )
+        self._session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retries))
+        
         # Create necessary directories
         os.makedirs(self.index_directory, exist_ok=True)
         os.makedirs(f"{self.index_directory}/chunks", exist_ok=True)
@@ -45,24 +115,89 @@ class OpenAI_Embedding:
             "encoding_format": self.encoding_format
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = self._session.post(url, headers=headers, json=payload)
         return response
 
-    def get_embedding(self, text: Union[str, List[str]]) -> np.ndarray:
-        """Get embeddings for a single text or list of texts"""
-        response = self._make_request(text)
+    def _embed_batch(self, input_text: Union[str, List[str]]) -> np.ndarray:
+        """Embed a single batch with one API call"""
+        response = self._make_request(input_text)
         
         if response.status_code != 200:
             raise Exception(f"Error in API call: {response.text}")
             
         result = response.json()
         
+        # Fill a preallocated float32 array row by row instead of building a list of lists
+        data = result["data"]
+        embeddings = np.empty((len(data), len(data[0]["embedding"])), dtype=np.float32)
+        for i, item in enumerate(data):
+            embeddings[i] = item["embedding"]
+        
+        return embeddings
+
+    def get_embedding(self, text: Union[str, List[str]]) -> np.ndarray:
+        """Get embeddings for a single text or list of texts"""
         # Handle single text input
         if isinstance(text, str):
-            return np.array(result["data"][0]["embedding"], dtype=np.float32)
+            return self._embed_batch(text)[0]
+        
+        # Split into provider-sized batches and embed them concurrently
+        batches = [text[i:i + self.batch_size] for i in range(0, len(text), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(text)
         
-        # Handle list of texts input
-        return np.array([item["embedding"] for item in result["data"]], dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(batches))) as executor:
+            results = list(executor.map(self._embed_batch, batches))
+        
+        return np.concatenate(results)
+
+    def _index_factory_string(self, num_vectors: int) -> str:
+        """Pick a FAISS index factory string for the index type and corpus size"""
+        if self.index_type == "hnsw":
+            return f"HNSW{self.hnsw_m},Flat"
+        if num_vectors < self.FLAT_INDEX_THRESHOLD:
+            return "Flat"
+        # FAISS k-means wants at least 39 training points per centroid
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        return f"IVF{nlist},SQ8"
+
+    def _build_index(self, embeddings: np.ndarray) -> Tuple[faiss.Index, str]:
+        """Build, train and fill a FAISS index for the given embeddings"""
+        index_factory = self._index_factory_string(embeddings.shape[0])
+        index = faiss.index_factory(embeddings.shape[1], index_factory, faiss.METRIC_INNER_PRODUCT)
+        
+        # OpenMP thread counts are per calling thread, so pin them on every FAISS call;
+        # distance kernels stop scaling past ~16 cores
+        if self.num_threads is not None:
+            faiss.omp_set_num_threads(self.num_threads)
+        
+        # HNSW builds its graph at add time, IVF/SQ indexes need training first
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = self.ef_construction
+        if not index.is_trained:
+            index.train(embeddings)
+        index.add(embeddings)
+        self._set_search_params(index, {})
+        
+        return index, index_factory
+
+    def _resolve_search_params(self, chunks_metadata: Dict) -> Tuple[int, int]:
+        """Pick nprobe/efSearch: explicit constructor values win, then the saved index, then defaults"""
+        nprobe = self.nprobe if self.nprobe is not None else chunks_metadata.get("nprobe", self.DEFAULT_NPROBE)
+        ef_search = self.ef_search if self.ef_search is not None else chunks_metadata.get("ef_search", self.DEFAULT_EF_SEARCH)
+        return nprobe, ef_search
+
+    def _set_search_params(self, index: faiss.Index, chunks_metadata: Dict):
+        """Set query-time parameters: nprobe for IVF indexes, efSearch for HNSW"""
+        nprobe, ef_search = self._resolve_search_params(chunks_metadata)
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            # GPU IVF indexes are not CPU IndexIVF subclasses but expose nprobe directly
+            if hasattr(index, "nprobe"):
+                index.nprobe = nprobe
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = ef_search
 
     def create_faiss_index(self, name: str, texts: List[str]) -> Tuple[faiss.Index, Dict]:
         """Create a FAISS index from a list of texts"""
@@ -72,28 +207,30 @@ class OpenAI_Embedding:
         # Ensure embeddings are in the correct shape and type
         embeddings = np.array(embeddings, dtype=np.float32)
         
+        # Normalize so that inner product equals cosine similarity
+        faiss.normalize_L2(embeddings)
+        
         # Get actual dimension from embeddings
         actual_dim = embeddings.shape[1]
         
         # Create FAISS index with the actual dimension
-        index = faiss.IndexFlatL2(actual_dim)
-        index.add(embeddings)
+        index, index_factory = self._build_index(embeddings)
         
         # Create chunks metadata
+        nprobe, ef_search = self._resolve_search_params({})
         chunks_metadata = {
             "created_at": datetime.now().isoformat(),
             "model": self.model,
             "encoding_format": self.encoding_format,
             "total_chunks": len(texts),
             "embedding_dim": actual_dim,
-            "chunks": [
-                {
-                    "id": i,
-                    "text": text,
-                    "embedding_index": i
-                }
-                for i, text in enumerate(texts)
-            ]
+            "index_factory": index_factory,
+            "nprobe": nprobe,
+            "ef_construction": self.ef_construction,
+            "ef_search": ef_search,
+            "store_embeddings": self.store_embeddings,
+            "metric": "inner_product",
+            "chunks": list(texts)
         }
         
         # Save index and metadata
@@ -101,17 +238,83 @@ class OpenAI_Embedding:
         
         return index, chunks_metadata
 
-    def save_index(self, name: str, index: faiss.Index, chunks_metadata: Dict, embeddings: np.ndarray):
+    def save_index(self, name: str, index: faiss.Index, chunks_metadata: Dict, embeddings: Optional[np.ndarray] = None):
         """Save FAISS index, chunks metadata, and embeddings"""
-        # Save FAISS index
-        faiss.write_index(index, f"{self.index_directory}/{name}.faiss")
+        # Drop any cached copy of the previous version
+        self._index_cache.pop(name, None)
         
-        # Save chunks metadata
-        with open(f"{self.index_directory}/chunks/{name}.json", 'w') as f:
-            json.dump(chunks_metadata, f, indent=2)
+        # Write FAISS index to a temporary file; it is swapped in last, below
+        index_path = f"{self.index_directory}/{name}.faiss"
+        faiss.write_index(index, f"{index_path}.tmp")
         
-        # Save embeddings
-        np.save(f"{self.index_directory}/embeddings/{name}.npy", embeddings)
+        # Save chunk texts as one UTF-8 blob plus byte offsets, chunk i is blob[offsets[i]:offsets[i + 1]]
+        encoded = [text.encode('utf-8') for text in chunks_metadata["chunks"]]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        texts_path = f"{self.index_directory}/chunks/{name}.texts.bin"
+        offsets_path = f"{self.index_directory}/chunks/{name}.offsets.npy"
+        metadata_path = f"{self.index_directory}/chunks/{name}.json"
+        with open(f"{texts_path}.tmp", 'wb') as f:
+            f.write(b"".join(encoded))
+        with open(f"{offsets_path}.tmp", 'wb') as f:
+            np.save(f, offsets)
+        
+        # Save the remaining metadata in a small JSON sidecar
+        metadata = {key: value for key, value in chunks_metadata.items() if key != "chunks"}
+        with open(f"{metadata_path}.tmp", 'w') as f:
+            json.dump(metadata, f, indent=2)
+        
+        # Swap files in reverse of the order readers load them (metadata, index, offsets, texts):
+        # texts, then offsets, then metadata, then the index last. Updates only append, so the
+        # old blob is a byte prefix of the new one and any mix of versions a reader can observe
+        # stays consistent. os.replace also leaves memory-mapped readers a valid old copy
+        os.replace(f"{texts_path}.tmp", texts_path)
+        os.replace(f"{offsets_path}.tmp", offsets_path)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+        os.replace(f"{index_path}.tmp", index_path)
+        
+        # Optionally save embeddings, the FAISS index already holds its own copy
+        if embeddings is not None:
+            self._save_embeddings(name, embeddings)
+
+    def _save_embeddings(self, name: str, embeddings: np.ndarray, trained: Optional[np.ndarray] = None):
+        """Save the embeddings copy in the store_embeddings format, reusing int8 ranges when given"""
+        if self.store_embeddings == "none":
+            return
+        path = f"{self.index_directory}/embeddings/{name}"
+        if self.store_embeddings == "fp32":
+            np.save(f"{path}.npy", embeddings)
+        elif self.store_embeddings == "fp16":
+            np.save(f"{path}.npy", embeddings.astype(np.float16))
+        else:
+            # 8-bit codes plus the trained ranges needed to decode them; reusing the previous
+            # ranges re-encodes already-decoded rows to the exact same codes
+            quantizer = faiss.ScalarQuantizer(embeddings.shape[1], faiss.ScalarQuantizer.QT_8bit)
+            if trained is None:
+                quantizer.train(embeddings)
+            else:
+                faiss.copy_array_to_vector(trained, quantizer.trained)
+            np.savez(f"{path}.npz", codes=quantizer.compute_codes(embeddings), trained=faiss.vector_to_array(quantizer.trained))
+
+    def _load_stored_embeddings(self, name: str, chunks_metadata: Dict) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Load and decode the stored embeddings copy, returning (embeddings, int8 ranges or None)"""
+        path = f"{self.index_directory}/embeddings/{name}"
+        
+        # Indexes saved before store_embeddings existed always kept an fp32 .npy
+        stored_as = chunks_metadata.get("store_embeddings", "fp32")
+        if stored_as in ("fp32", "fp16") and os.path.exists(f"{path}.npy"):
+            return np.load(f"{path}.npy").astype(np.float32), None
+        if stored_as == "int8" and os.path.exists(f"{path}.npz"):
+            stored = np.load(f"{path}.npz")
+            quantizer = faiss.ScalarQuantizer(stored["codes"].shape[1], faiss.ScalarQuantizer.QT_8bit)
+            faiss.copy_array_to_vector(stored["trained"], quantizer.trained)
+            return quantizer.decode(stored["codes"]), stored["trained"]
+        return None, None
+
+    def _is_lossy(self, chunks_metadata: Dict) -> bool:
+        """Whether the index keeps compressed (SQ/PQ) vectors that only reconstruct approximately"""
+        index_factory = chunks_metadata.get("index_factory", "Flat")
+        return "SQ" in index_factory or "PQ" in index_factory
 
     def load_index(self, name: str) -> Tuple[faiss.Index, Dict, np.ndarray]:
         """Load FAISS index, chunks metadata, and embeddings"""
@@ -119,78 +322,217 @@ class OpenAI_Embedding:
         index = faiss.read_index(f"{self.index_directory}/{name}.faiss")
         
         # Load chunks metadata
-        with open(f"{self.index_directory}/chunks/{name}.json", 'r') as f:
-            chunks_metadata = json.load(f)
+        chunks_metadata = self._load_metadata(name)
+        chunks_metadata["chunks"] = self._load_chunks(name)
+        
+        # Restore the persisted search parameters
+        self._set_search_params(index, chunks_metadata)
         
-        # Load embeddings
-        embeddings = np.load(f"{self.index_directory}/embeddings/{name}.npy")
+        # Rebuild embeddings from the FAISS index rather than a separate file
+        embeddings = self._reconstruct_embeddings(index)
         
         return index, chunks_metadata, embeddings
 
+    def _reconstruct_embeddings(self, index: faiss.Index) -> np.ndarray:
+        """Reconstruct all stored vectors from the index (lossy for SQ8 indexes)"""
+        try:
+            faiss.extract_index_ivf(index).make_direct_map()
+        except RuntimeError:
+            pass
+        return index.reconstruct_n(0, index.ntotal)
+
+    def _load_metadata(self, name: str) -> Dict:
+        """Load the index-level metadata without the chunk texts"""
+        with open(f"{self.index_directory}/chunks/{name}.json", 'r') as f:
+            metadata = json.load(f)
+        metadata.pop("chunks", None)
+        return metadata
+
+    def _load_texts(self, name: str) -> Tuple[np.ndarray, Union[mmap.mmap, bytes]]:
+        """Load chunk byte offsets and a memory-mapped view of the chunk texts blob"""
+        texts_path = f"{self.index_directory}/chunks/{name}.texts.bin"
+        
+        # Indexes saved before the texts blob keep their chunks in the JSON file
+        if not os.path.exists(texts_path):
+            with open(f"{self.index_directory}/chunks/{name}.json", 'r') as f:
+                encoded = [chunk["text"].encode('utf-8') for chunk in json.load(f)["chunks"]]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(text) for text in encoded], out=offsets[1:])
+            return offsets, b"".join(encoded)
+        
+        offsets = np.load(f"{self.index_directory}/chunks/{name}.offsets.npy")
+        if offsets[-1] == 0:
+            return offsets, b""
+        with open(texts_path, 'rb') as f:
+            texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return offsets, texts
+
+    def _load_chunks(self, name: str) -> List[str]:
+        """Load all chunk texts"""
+        offsets, texts = self._load_texts(name)
+        return [texts[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    def _load_for_search(self, name: str, use_mmap: bool = True) -> Tuple[faiss.Index, Dict]:
+        """Load only what search needs: the FAISS index and index-level metadata"""
+        chunks_metadata = self._load_metadata(name)
+        
+        # Memory-map IVF indexes so inverted lists are paged in only as nprobe touches them
+        io_flags = 0
+        if use_mmap and "IVF" in chunks_metadata.get("index_factory", ""):
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(f"{self.index_directory}/{name}.faiss", io_flags)
+        
+        return index, chunks_metadata
+
+    def _to_gpu(self, index: faiss.Index, chunks_metadata: Dict) -> faiss.Index:
+        """Copy a Flat/IVF index to GPU 0 when use_gpu is set, otherwise return it unchanged"""
+        # FAISS has no GPU implementation of HNSW
+        if not self.use_gpu or "HNSW" in chunks_metadata.get("index_factory", ""):
+            return index
+        
+        if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+            warnings.warn("use_gpu is set but no FAISS GPU is available; falling back to CPU search")
+            self.use_gpu = False
+            return index
+        
+        # GPU resources (scratch memory, streams) are created once and shared by all indexes
+        if self._gpu_resources is None:
+            self._gpu_resources = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
+
+    def _load_cached(self, name: str) -> Tuple[faiss.Index, Dict, np.ndarray, Union[mmap.mmap, bytes]]:
+        """Load FAISS index, metadata and chunk texts for search, reusing recently loaded indexes"""
+        if name in self._index_cache:
+            self._index_cache.move_to_end(name)
+            return self._index_cache[name]
+        
+        # GPU indexes are copied into device memory, so there is nothing to gain from mmap
+        index, chunks_metadata = self._load_for_search(name, use_mmap=not self.use_gpu)
+        index = self._to_gpu(index, chunks_metadata)
+        
+        # Set query-time parameters once; cached indexes keep them across searches
+        self._set_search_params(index, chunks_metadata)
+        offsets, texts = self._load_texts(name)
+        
+        # Keep at most index_cache_size indexes, evicting the least recently used
+        self._index_cache[name] = (index, chunks_metadata, offsets, texts)
+        if len(self._index_cache) > self.index_cache_size:
+            self._index_cache.popitem(last=False)
+        
+        return index, chunks_metadata, offsets, texts
+
     def search(self, name: str, query: str, k: int = 5) -> List[Dict]:
         """Search similar texts using FAISS"""
-        # Load index and metadata
-        index, chunks_metadata, _ = self.load_index(name)
+        return self.batch_search(name, [query], k)[0]
+
+    def batch_search(self, name: str, queries: List[str], k: int = 5) -> List[List[Dict]]:
+        """Search similar texts for several queries with one embedding call and one FAISS search"""
+        if not queries:
+            return []
+        
+        # Load index, metadata and chunk texts
+        index, chunks_metadata, offsets, texts = self._load_cached(name)
         
-        # Get query embedding
-        query_embedding = self.get_embedding(query)
+        # Get all query embeddings in a single API call, already shaped (Q, d) for FAISS
+        query_embeddings = self.get_embedding(queries)
         
-        # Reshape for FAISS
-        query_embedding = query_embedding.reshape(1, -1)
+        # FAISS needs C-contiguous float32; only copy when the embedding isn't already
+        if query_embeddings.dtype != np.float32 or not query_embeddings.flags['C_CONTIGUOUS']:
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
         
-        # Search
-        distances, indices = index.search(query_embedding, k)
+        # Indexes built before the switch to cosine similarity use raw L2
+        metric = chunks_metadata.get("metric", "l2")
+        if metric == "inner_product":
+            faiss.normalize_L2(query_embeddings)
+        
+        # Search, parallelizing over at most one thread per query; restore this thread's
+        # OpenMP setting afterwards so other FAISS work it does keeps its own thread count
+        previous_threads = faiss.omp_get_max_threads()
+        try:
+            if self.num_threads is not None:
+                faiss.omp_set_num_threads(min(self.num_threads, len(queries)))
+            distances, indices = index.search(query_embeddings, k)
+        finally:
+            faiss.omp_set_num_threads(previous_threads)
         
-        # Get results with metadata
-        results = []
-        for i, (dist, idx) in enumerate(zip(distances[0], indices[0])):
-            chunk = chunks_metadata["chunks"][idx]
-            results.append({
-                "chunk_id": chunk["id"],
-                "text": chunk["text"],
-                "distance": float(dist),
-                "score": 1 / (1 + float(dist)),  # Convert distance to similarity score
-                "rank": i + 1
-            })
+        # Convert distances to similarity scores in one vectorized step
+        scores = distances if metric == "inner_product" else 1.0 / (1.0 + distances)
         
-        return results
+        # Get results with metadata, one list per query (-1 marks a missing hit)
+        all_results = []
+        for query_indices, query_distances, query_scores in zip(indices.tolist(), distances.tolist(), scores.tolist()):
+            hits = [
+                (idx, dist, score)
+                for idx, dist, score in zip(query_indices, query_distances, query_scores)
+                if idx >= 0
+            ]
+            all_results.append([
+                {
+                    "chunk_id": idx,
+                    "text": texts[offsets[idx]:offsets[idx + 1]].decode('utf-8'),
+                    "distance": dist,
+                    "score": score,
+                    "rank": rank
+                }
+                for rank, (idx, dist, score) in enumerate(hits, 1)
+            ])
+        
+        return all_results
 
     def update_index(self, name: str, new_texts: List[str]):
         """Update existing index with new texts"""
         try:
-            index, chunks_metadata, embeddings = self.load_index(name)
+            index, chunks_metadata = self._load_for_search(name, use_mmap=False)
+            chunks_metadata["chunks"] = self._load_chunks(name)
         except FileNotFoundError:
             print(f"Index {name} not found. Creating new index...")
             self.create_faiss_index(name, new_texts)
             return
 
+        # Flat/HNSW indexes reconstruct stored vectors exactly; SQ/PQ indexes only approximately,
+        # so for those extend the previously stored copy instead of re-deriving it from the index
+        existing_embeddings, trained = None, None
+        if self.store_embeddings != "none" and self._is_lossy(chunks_metadata):
+            existing_embeddings, trained = self._load_stored_embeddings(name, chunks_metadata)
+            if existing_embeddings is None:
+                raise ValueError(
+                    f"Index {name} uses lossy {chunks_metadata['index_factory']} vectors and has no stored "
+                    f"embeddings to extend; use store_embeddings='none' to update it"
+                )
+            if self.store_embeddings != "int8":
+                trained = None
+
         # Get embeddings for new texts
-        new_embeddings = self.get_embedding(new_texts)
+        new_embeddings = np.array(self.get_embedding(new_texts), dtype=np.float32)
+        if chunks_metadata.get("metric", "l2") == "inner_product":
+            faiss.normalize_L2(new_embeddings)
         
-        # Update embeddings array
-        embeddings = np.vstack([embeddings, new_embeddings])
+        # Add only the new vectors to the existing FAISS index
+        if self.num_threads is not None:
+            faiss.omp_set_num_threads(self.num_threads)
+        index.add(new_embeddings)
         
-        # Get dimension from embeddings
-        actual_dim = embeddings.shape[1]
+        actual_dim = new_embeddings.shape[1]
         
-        # Update FAISS index
-        index = faiss.IndexFlatL2(actual_dim)
-        index.add(embeddings)
+        # Only materialize the full embeddings matrix when it is stored on disk
+        embeddings = None
+        if existing_embeddings is not None:
+            # Fill old and new rows into a single preallocated buffer
+            num_existing = existing_embeddings.shape[0]
+            embeddings = np.empty((num_existing + new_embeddings.shape[0], actual_dim), dtype=np.float32)
+            embeddings[:num_existing] = existing_embeddings
+            embeddings[num_existing:] = new_embeddings
+        elif self.store_embeddings != "none":
+            embeddings = self._reconstruct_embeddings(index)
         
         # Update chunks metadata
-        start_id = len(chunks_metadata["chunks"])
-        new_chunks = [
-            {
-                "id": start_id + i,
-                "text": text,
-                "embedding_index": start_id + i
-            }
-            for i, text in enumerate(new_texts)
-        ]
-        chunks_metadata["chunks"].extend(new_chunks)
+        chunks_metadata["chunks"].extend(new_texts)
         chunks_metadata["total_chunks"] = len(chunks_metadata["chunks"])
         chunks_metadata["updated_at"] = datetime.now().isoformat()
         chunks_metadata["embedding_dim"] = actual_dim
+        chunks_metadata["store_embeddings"] = self.store_embeddings
         
         # Save updated index and metadata
-        self.save_index(name, index, chunks_metadata, embeddings)
+        self.save_index(name, index, chunks_metadata)
+        if embeddings is not None:
+            self._save_embeddings(name, embeddings, trained)